@@ -0,0 +1,80 @@
+"""
+HTTP helpers shared by the scrapers
+Pooled, on-disk cached session, a thread-safe token bucket and a retry policy
+"""
+
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests_cache import CachedSession
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
+
+# Identify the scrapers to the servers
+USER_AGENT = "fiqh-mcp-server-scraper/1.0"
+
+# On-disk HTTP response cache shared by the scrapers
+HTTP_CACHE_FILE = Path(__file__).parent.parent / 'cache' / 'http_cache.sqlite'
+HTTP_CACHE_EXPIRE_AFTER = 86400 * 30  # 30 days
+
+# Concurrent fetches; the rate limiter keeps the aggregate pace respectful
+MAX_WORKERS = 8
+RATE_LIMIT_CALLS = 2
+RATE_LIMIT_PERIOD = 1.0  # seconds
+
+# Retry transient request failures with exponential backoff
+retry_transient = retry(
+    stop=stop_after_attempt(4),
+    wait=wait_exponential(multiplier=0.5, min=0.5, max=8),
+    retry=retry_if_exception_type(requests.RequestException),
+    reraise=True,
+)
+
+
+def configure_session(session: requests.Session) -> requests.Session:
+    """Give a session a large keep-alive connection pool and the scraper User-Agent"""
+    session.mount('https://', HTTPAdapter(pool_connections=32, pool_maxsize=32))
+    session.headers.update({'User-Agent': USER_AGENT})
+    return session
+
+
+def create_session(filter_fn: Optional[Callable[[requests.Response], bool]] = None) -> CachedSession:
+    """Create a pooled, on-disk cached HTTP session
+
+    filter_fn, if given, decides per response whether it may be cached.
+    """
+    # 404s are cached too, so missing IDs are not probed again on reruns
+    return configure_session(CachedSession(
+        str(HTTP_CACHE_FILE),
+        backend='sqlite',
+        expire_after=HTTP_CACHE_EXPIRE_AFTER,
+        allowable_codes=[200, 404],
+        filter_fn=filter_fn,
+    ))
+
+
+class RateLimiter:
+    """Thread-safe token bucket allowing max_calls per period across all workers"""
+
+    def __init__(self, max_calls: int, period: float):
+        self.capacity = max_calls
+        self.refill_rate = max_calls / period
+        self.tokens = float(max_calls)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """Block until a token is available, then take it"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.refill_rate
+            time.sleep(delay)
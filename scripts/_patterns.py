@@ -0,0 +1,40 @@
+"""
+Text patterns shared by the scrapers and the processing script
+Compiled once at import, so pool workers reuse them instead of recompiling
+"""
+
+import re
+
+# Runs of whitespace
+WS_RE = re.compile(r'\s+')
+
+# HTML tags
+TAG_RE = re.compile(r'<[^>]+>')
+
+# HTML entities and tags, handled together in a single regex pass
+ENTITY_RE = re.compile(r'&(nbsp|quot|amp|lt|gt);|<[^>]+>')
+ENTITY_MAP = {'nbsp': ' ', 'quot': '"', 'amp': '&', 'lt': '<', 'gt': '>'}
+
+# Curly quotes to their ASCII equivalents
+QUOTE_TRANS = str.maketrans({'\u201c': '"', '\u201d': '"', '\u2018': "'", '\u2019': "'"})
+
+# Quran and hadith reference patterns
+QURAN_PATTERNS = [
+    r'(?:Surah|Chapter)\s+[\w-]+\s*[:,]\s*(?:Ayah|Verse)\s+\d+',
+    r'(?:Quran|Al-Quran)\s+\d+:\d+',
+    r'\[\d+:\d+\]',
+]
+HADITH_PATTERNS = [
+    r'(?:Bukhari|Muslim|Tirmidhi|Abu Dawud|Ibn Majah|Nasai)\s+\d+',
+    r'Sahih\s+(?P<collection>Bukhari|Muslim)',
+]
+
+# All reference patterns combined so the text is scanned once
+EVIDENCE_RE = re.compile(
+    '|'.join(f'(?:{pattern})' for pattern in QURAN_PATTERNS + HADITH_PATTERNS),
+    re.IGNORECASE,
+)
+
+# Numbered hadith citation, tried again at the collection name of a
+# "Sahih Bukhari 55" match so the number is not lost to the overlap
+HADITH_NUMBER_RE = re.compile(HADITH_PATTERNS[0], re.IGNORECASE)
@@ -5,15 +5,34 @@ Convert AhmedBaset hadith-json dataset to FiqhEntry schema
 
 import json
 import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple
 from tqdm import tqdm
+import ahocorasick
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
 
 # Paths
 BASE_DIR = Path(__file__).parent.parent
 HADITH_DIR = BASE_DIR / 'temp_hadith_ahmed' / 'db' / 'by_book' / 'the_9_books'
 OUTPUT_DIR = BASE_DIR / 'data' / 'raw' / 'hadith'
 
+# Per-collection progress bars (disabled inside worker processes)
+SHOW_PROGRESS = True
+
+# Reusable simdjson parser: keeps its internal buffers across collections.
+# Each worker process gets its own copy (parsers must not be shared).
+PARSER = simdjson.Parser() if simdjson else None
+
 # Collection metadata
 COLLECTION_INFO = {
     'bukhari': {
@@ -90,89 +109,112 @@ COLLECTION_INFO = {
     }
 }
 
+# Topic mapping
+TOPIC_KEYWORDS = {
+    'prayer': ['prayer', 'salah', 'salat', 'praying'],
+    'fasting': ['fasting', 'fast', 'sawm', 'ramadan'],
+    'zakat': ['zakat', 'charity', 'alms'],
+    'hajj': ['hajj', 'pilgrimage', 'umrah'],
+    'purification': ['purification', 'wudu', 'ablution', 'ghusl', 'tayammum'],
+    'faith': ['faith', 'belief', 'iman', 'creed'],
+    'marriage': ['marriage', 'nikah', 'divorce', 'talaq'],
+    'trade': ['trade', 'business', 'transactions', 'buying', 'selling'],
+    'food': ['food', 'drink', 'eating', 'slaughtering'],
+    'clothing': ['clothing', 'dress', 'garment'],
+    'funeral': ['funeral', 'burial', 'death', 'janazah'],
+    'jihad': ['jihad', 'fighting', 'warfare'],
+    'knowledge': ['knowledge', 'learning', 'teaching'],
+    'manners': ['manners', 'adab', 'etiquette', 'behavior'],
+}
+
+
+def build_topic_automaton(topic_keywords: Dict[str, List[str]]) -> ahocorasick.Automaton:
+    """Build an Aho-Corasick automaton mapping each keyword to its topic"""
+    automaton = ahocorasick.Automaton()
+    for topic, keywords in topic_keywords.items():
+        for keyword in keywords:
+            automaton.add_word(keyword, topic)
+    automaton.make_automaton()
+    return automaton
+
+
+TOPIC_AUTOMATON = build_topic_automaton(TOPIC_KEYWORDS)
+
 
 def extract_topics_from_chapter(chapter_name: str) -> List[str]:
     """Extract topic tags from chapter name"""
     if not chapter_name:
         return ['general']
 
-    # Convert to lowercase and clean
+    # Convert to lowercase and scan once for every topic keyword
     chapter_lower = chapter_name.lower()
+    matched = {topic for _, topic in TOPIC_AUTOMATON.iter(chapter_lower)}
 
-    # Topic mapping
-    topic_keywords = {
-        'prayer': ['prayer', 'salah', 'salat', 'praying'],
-        'fasting': ['fasting', 'fast', 'sawm', 'ramadan'],
-        'zakat': ['zakat', 'charity', 'alms'],
-        'hajj': ['hajj', 'pilgrimage', 'umrah'],
-        'purification': ['purification', 'wudu', 'ablution', 'ghusl', 'tayammum'],
-        'faith': ['faith', 'belief', 'iman', 'creed'],
-        'marriage': ['marriage', 'nikah', 'divorce', 'talaq'],
-        'trade': ['trade', 'business', 'transactions', 'buying', 'selling'],
-        'food': ['food', 'drink', 'eating', 'slaughtering'],
-        'clothing': ['clothing', 'dress', 'garment'],
-        'funeral': ['funeral', 'burial', 'death', 'janazah'],
-        'jihad': ['jihad', 'fighting', 'warfare'],
-        'knowledge': ['knowledge', 'learning', 'teaching'],
-        'manners': ['manners', 'adab', 'etiquette', 'behavior'],
-    }
-
-    topics = []
-    for topic, keywords in topic_keywords.items():
-        if any(keyword in chapter_lower for keyword in keywords):
-            topics.append(topic)
-
-    # If no topics found, use 'general'
+    # Keep topics in TOPIC_KEYWORDS order; if none found, use 'general'
+    topics = [topic for topic in TOPIC_KEYWORDS if topic in matched]
     return topics if topics else ['general']
 
 
-def convert_hadith(hadith: Dict, collection_key: str, chapters_map: Dict) -> Dict:
-    """Convert a single hadith to FiqhEntry format"""
-    collection = COLLECTION_INFO[collection_key]
+def convert_hadith(
+    hadith: Dict,
+    collection_key: str,
+    chapters_map: Dict[Any, str],
+    col_meta: Tuple[str, str, str, str],
+) -> Optional[Dict]:
+    """Convert a single hadith to FiqhEntry format, or None if it has no text
 
-    # Get chapter info for topics
-    chapter_id = hadith.get('chapterId')
-    chapter = chapters_map.get(chapter_id, {})
-    chapter_name = chapter.get('english', '')
-
-    # Extract topics
-    topics = extract_topics_from_chapter(chapter_name)
+    col_meta is the collection's (url_base, english_name, authenticity,
+    collection) from COLLECTION_INFO, looked up once per collection.
+    """
+    url_base, name, authenticity, collection = col_meta
+    hadith_get = hadith.get
 
     # Build narrator and text
-    english_data = hadith.get('english', {})
-    narrator = english_data.get('narrator', '')
-    text = english_data.get('text', '')
+    english_get = hadith_get('english', {}).get
+    narrator = english_get('narrator', '')
+    text = english_get('text', '')
+    arabic = hadith_get('arabic', '')
 
     # Combine for ruling field
     if narrator and text:
-        ruling = f"{narrator}\n\n{text}"
+        ruling = f"{narrator}\n\n{text}".strip()
     else:
-        ruling = text or hadith.get('arabic', '')
+        ruling = (text or arabic).strip()
+
+    # Skip hadiths without any text before building the rest of the entry
+    if not ruling:
+        return None
+
+    # Get chapter name for topics
+    chapter_name = chapters_map.get(hadith_get('chapterId'), '')
+
+    # Extract topics
+    topics = extract_topics_from_chapter(chapter_name)
 
     # Build reference
-    book_id = hadith.get('bookId', '?')
-    hadith_num = hadith.get('idInBook', hadith.get('id', '?'))
+    book_id = hadith_get('bookId', '?')
+    hadith_num = hadith_get('idInBook', hadith_get('id', '?'))
     reference = f"Book {book_id}, Hadith {hadith_num}"
 
     # Build URL
-    url = f"{collection['url_base']}/{hadith_num}"
+    url = f"{url_base}/{hadith_num}"
 
     # Build FiqhEntry
     entry = {
-        'id': f"{collection_key}_{hadith.get('id', hadith_num)}",
+        'id': f"{collection_key}_{hadith_get('id', hadith_num)}",
         'type': 'hadith',
-        'ruling': ruling.strip(),
+        'ruling': ruling,
         'evidence': [],  # Hadith themselves are evidence
         'source': {
-            'title': collection['english_name'],
+            'title': name,
             'reference': reference,
             'url': url,
-            'collection': collection['collection']
+            'collection': collection
         },
         'madhab': 'general',  # Hadith not specific to madhab
         'topics': topics,
-        'authenticity': collection['authenticity'],
-        'arabicText': hadith.get('arabic', ''),
+        'authenticity': authenticity,
+        'arabicText': arabic,
     }
 
     return entry
@@ -189,27 +231,44 @@ def process_collection(collection_key: str) -> List[Dict]:
     print(f"\nProcessing {collection_key}...")
 
     try:
-        with open(json_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        with open(json_file, 'rb') as f:
+            raw = f.read()
+
+        # With simdjson, hadith objects stay lazy proxies until convert_hadith
+        # reads their fields
+        if PARSER:
+            data = PARSER.parse(raw)
+        else:
+            data = orjson.loads(raw) if orjson else json.loads(raw)
 
         # Get metadata
         metadata = data.get('metadata', {})
         hadith_count = metadata.get('length', 0)
         print(f"Found {hadith_count} hadiths in {collection_key}")
 
-        # Build chapters map for topic extraction
-        chapters_map = {}
-        for chapter in data.get('chapters', []):
-            chapters_map[chapter['id']] = chapter
+        # Map chapter ids to English chapter names for topic extraction
+        chapters_map = {
+            chapter['id']: chapter.get('english', '')
+            for chapter in data.get('chapters') or ()
+        }
+
+        # Look up collection metadata once rather than per hadith
+        collection = COLLECTION_INFO[collection_key]
+        col_meta = (
+            collection['url_base'],
+            collection['english_name'],
+            collection['authenticity'],
+            collection['collection'],
+        )
 
         # Convert all hadiths
         entries = []
         hadiths = data.get('hadiths', [])
 
-        for hadith in tqdm(hadiths, desc=f"Converting {collection_key}"):
+        for hadith in tqdm(hadiths, desc=f"Converting {collection_key}", disable=not SHOW_PROGRESS):
             try:
-                entry = convert_hadith(hadith, collection_key, chapters_map)
-                if entry['ruling']:  # Only include if we have text
+                entry = convert_hadith(hadith, collection_key, chapters_map, col_meta)
+                if entry is not None:  # Only include if we have text
                     entries.append(entry)
             except Exception as e:
                 print(f"\nError converting hadith {hadith.get('id')}: {e}")
@@ -223,6 +282,12 @@ def process_collection(collection_key: str) -> List[Dict]:
         return []
 
 
+def init_worker():
+    """Silence per-collection progress bars in worker processes"""
+    global SHOW_PROGRESS
+    SHOW_PROGRESS = False
+
+
 def main():
     """Main conversion function"""
     print("="*60)
@@ -233,32 +298,45 @@ def main():
     # Create output directory
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
-    # Process all collections
-    all_entries = []
-
-    for collection_key in COLLECTION_INFO.keys():
-        entries = process_collection(collection_key)
-        all_entries.extend(entries)
-
-    # Save combined output
-    output_file = OUTPUT_DIR / 'all_hadith.json'
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(all_entries, f, ensure_ascii=False, indent=2)
+    # Process all collections in parallel (each collection is independent)
+    # and stream entries to a JSON Lines file as each collection finishes
+    output_file = OUTPUT_DIR / 'all_hadith.jsonl'
+    collection_counts = {}
+    total_entries = 0
+
+    max_workers = min(len(COLLECTION_INFO), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker) as executor, \
+            open(output_file, 'wb') as f:
+        for collection_key, entries in zip(
+            COLLECTION_INFO, executor.map(process_collection, COLLECTION_INFO)
+        ):
+            for entry in entries:
+                if orjson:
+                    f.write(orjson.dumps(entry))
+                else:
+                    f.write(json.dumps(entry, ensure_ascii=False).encode('utf-8'))
+                f.write(b'\n')
+
+            if entries:
+                collection_counts[COLLECTION_INFO[collection_key]['english_name']] = len(entries)
+            total_entries += len(entries)
+
+    # Remove the JSON array written by earlier versions, otherwise
+    # process_texts.py would load every hadith twice
+    legacy_file = OUTPUT_DIR / 'all_hadith.json'
+    if legacy_file.exists():
+        legacy_file.unlink()
+        print(f"Removed old output file: {legacy_file}")
 
     print("\n" + "="*60)
     print("Conversion Complete!")
     print("="*60)
-    print(f"Total hadiths converted: {len(all_entries)}")
+    print(f"Total hadiths converted: {total_entries}")
     print(f"Output file: {output_file}")
     print(f"File size: {output_file.stat().st_size / (1024*1024):.1f} MB")
 
     # Print statistics
     print("\nBreakdown by collection:")
-    collection_counts = {}
-    for entry in all_entries:
-        source = entry['source']['title']
-        collection_counts[source] = collection_counts.get(source, 0) + 1
-
     for collection, count in sorted(collection_counts.items()):
         print(f"  {collection}: {count}")
 
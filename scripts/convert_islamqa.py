@@ -3,29 +3,104 @@
 Convert IslamQA dataset to FiqhEntry schema
 """
 
+import argparse
 import json
 import csv
+import multiprocessing as mp
+import os
 import re
+import unicodedata
 from pathlib import Path
-from typing import Dict, List
+from operator import itemgetter
+from typing import Dict, Iterator, List, Optional, Tuple
 from tqdm import tqdm
+import ahocorasick
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Paths
 BASE_DIR = Path(__file__).parent.parent
 ISLAMQA_FILE = BASE_DIR / 'temp_islamqa' / 'islamqascprapping.csv'
 OUTPUT_DIR = BASE_DIR / 'data' / 'raw' / 'fatawa'
 
+# CSV columns used by convert_fatwa, in the order it expects them
+CSV_COLUMNS = ('رقم السؤال', 'الرابط', 'العنوان', 'السؤال', 'ملخص الإجابة', 'الإجابة الكاملة')
+
+# Topic keywords for fatawa
+TOPIC_KEYWORDS = {
+    'prayer': ['صلاة', 'صلوات', 'prayer', 'salah', 'صلى'],
+    'fasting': ['صيام', 'صوم', 'fasting', 'رمضان', 'ramadan'],
+    'zakat': ['زكاة', 'zakat', 'charity'],
+    'hajj': ['حج', 'عمرة', 'hajj', 'umrah'],
+    'purification': ['طهارة', 'وضوء', 'غسل', 'purification', 'wudu'],
+    'marriage': ['زواج', 'نكاح', 'طلاق', 'marriage', 'divorce'],
+    'faith': ['إيمان', 'عقيدة', 'faith', 'belief'],
+    'quran': ['قرآن', 'quran', 'recitation', 'تلاوة'],
+    'hadith': ['حديث', 'hadith', 'سنة'],
+    'family': ['أسرة', 'أهل', 'family', 'والدين', 'parents'],
+    'business': ['معاملات', 'بيع', 'شراء', 'تجارة', 'business', 'trade'],
+    'inheritance': ['ميراث', 'inheritance', 'وراثة'],
+    'food': ['طعام', 'أكل', 'food', 'eating'],
+    'manners': ['أخلاق', 'آداب', 'manners', 'behavior'],
+    'worship': ['عبادة', 'عبادات', 'worship'],
+}
+
+
+# Fold hamza-carrying Alef forms to bare Alef when matching keywords
+ALEF_TABLE = str.maketrans('أإآ', 'ااا')
+
+# Honorific ligatures (ﷺ, ﷻ) expand under NFKC into phrases containing
+# keywords such as صلى, so they are blanked before matching
+HONORIFIC_TABLE = str.maketrans({'\ufdfa': ' ', '\ufdfb': ' '})
+
+
+def normalize_for_matching(text: str) -> str:
+    """NFKC-normalize a copy of text and fold Alef variants for keyword matching"""
+    text = text.translate(HONORIFIC_TABLE)
+    return unicodedata.normalize('NFKC', text).translate(ALEF_TABLE)
+
+
+def build_topic_automaton(topic_keywords: Dict[str, List[str]]) -> ahocorasick.Automaton:
+    """Build an Aho-Corasick automaton mapping each normalized keyword to its topic"""
+    automaton = ahocorasick.Automaton()
+    for topic, keywords in topic_keywords.items():
+        for keyword in keywords:
+            automaton.add_word(normalize_for_matching(keyword), topic)
+    automaton.make_automaton()
+    return automaton
+
+
+TOPIC_AUTOMATON = build_topic_automaton(TOPIC_KEYWORDS)
+
+
+def build_keyword_automaton(keywords: List[str]) -> ahocorasick.Automaton:
+    """Build an Aho-Corasick automaton that reports each matched keyword"""
+    automaton = ahocorasick.Automaton()
+    for keyword in keywords:
+        automaton.add_word(normalize_for_matching(keyword), keyword)
+    automaton.make_automaton()
+    return automaton
+
+
+# Quran verse reference patterns, combined into a single alternation
+QURAN_VERSE_RE = re.compile(r'سورة\s+\w+\s*[:：]\s*\d+|\[[\w\s]+:\s*\d+\]')
+
+# Hadith reference phrases
+HADITH_KEYWORDS = ['رواه البخاري', 'رواه مسلم', 'متفق عليه', 'صحيح البخاري', 'صحيح مسلم']
+HADITH_AUTOMATON = build_keyword_automaton(HADITH_KEYWORDS)
+
 
 def clean_text(text: str) -> str:
     """Clean and normalize text"""
     if not text:
         return ''
 
-    # Remove extra whitespace
-    text = re.sub(r'\s+', ' ', text)
-    text = text.strip()
-
-    return text
+    # Collapse and trim whitespace (str.split handles Unicode whitespace too);
+    # stored text keeps its original code points
+    return ' '.join(text.split())
 
 
 def extract_topics_from_title(title: str) -> List[str]:
@@ -33,71 +108,45 @@ def extract_topics_from_title(title: str) -> List[str]:
     if not title:
         return ['general']
 
-    title_lower = title.lower()
-
-    # Topic keywords for fatawa
-    topic_keywords = {
-        'prayer': ['صلاة', 'صلوات', 'prayer', 'salah', 'صلى'],
-        'fasting': ['صيام', 'صوم', 'fasting', 'رمضان', 'ramadan'],
-        'zakat': ['زكاة', 'zakat', 'charity'],
-        'hajj': ['حج', 'عمرة', 'hajj', 'umrah'],
-        'purification': ['طهارة', 'وضوء', 'غسل', 'purification', 'wudu'],
-        'marriage': ['زواج', 'نكاح', 'طلاق', 'marriage', 'divorce'],
-        'faith': ['إيمان', 'عقيدة', 'faith', 'belief'],
-        'quran': ['قرآن', 'quran', 'recitation', 'تلاوة'],
-        'hadith': ['حديث', 'hadith', 'سنة'],
-        'family': ['أسرة', 'أهل', 'family', 'والدين', 'parents'],
-        'business': ['معاملات', 'بيع', 'شراء', 'تجارة', 'business', 'trade'],
-        'inheritance': ['ميراث', 'inheritance', 'وراثة'],
-        'food': ['طعام', 'أكل', 'food', 'eating'],
-        'manners': ['أخلاق', 'آداب', 'manners', 'behavior'],
-        'worship': ['عبادة', 'عبادات', 'worship'],
-    }
-
-    topics = []
-    for topic, keywords in topic_keywords.items():
-        if any(keyword in title_lower for keyword in keywords):
-            topics.append(topic)
+    # Scan a normalized copy once for every topic keyword
+    title_lower = normalize_for_matching(title.lower())
+    matched = {topic for _, topic in TOPIC_AUTOMATON.iter(title_lower)}
 
+    # Keep topics in TOPIC_KEYWORDS order
+    topics = [topic for topic in TOPIC_KEYWORDS if topic in matched]
     return topics if topics else ['general']
 
 
 def extract_evidence(text: str) -> List[str]:
     """Extract Quran verses and hadith references from text"""
-    evidence = []
-
     # Look for Quran verse patterns (Arabic numbering)
-    quran_patterns = [
-        r'سورة\s+\w+\s*[:：]\s*\d+',
-        r'\[[\w\s]+:\s*\d+\]',
-    ]
+    evidence = QURAN_VERSE_RE.findall(text)
 
-    for pattern in quran_patterns:
-        matches = re.findall(pattern, text)
-        evidence.extend(matches)
+    # Look for hadith references in a normalized copy (the stored evidence is
+    # the keyword itself, so the text is never modified)
+    evidence.extend(keyword for _, keyword in HADITH_AUTOMATON.iter(normalize_for_matching(text)))
 
-    # Look for hadith references
-    hadith_keywords = ['رواه البخاري', 'رواه مسلم', 'متفق عليه', 'صحيح البخاري', 'صحيح مسلم']
-    for keyword in hadith_keywords:
-        if keyword in text:
-            evidence.append(keyword)
+    # Remove duplicates, keeping first-seen order
+    return list(dict.fromkeys(evidence))
 
-    # Remove duplicates
-    return list(set(evidence))
 
+def convert_fatwa(fields: Tuple[str, ...]) -> Optional[Dict]:
+    """Convert a single fatwa to FiqhEntry format, or None if it has no ruling
 
-def convert_fatwa(row: Dict) -> Dict:
-    """Convert a single fatwa to FiqhEntry format"""
+    fields holds the row's values for CSV_COLUMNS, in that order.
+    """
     # Get fields
-    fatwa_id = row.get('رقم السؤال', '')
-    url = row.get('الرابط', '')
-    title = clean_text(row.get('العنوان', ''))
-    question = clean_text(row.get('السؤال', ''))
-    summary = clean_text(row.get('ملخص الإجابة', ''))
-    full_answer = clean_text(row.get('الإجابة الكاملة', ''))
+    fatwa_id, url, title, question, summary, full_answer = fields
 
     # Use full answer if available, otherwise summary
-    ruling = full_answer if full_answer else summary
+    ruling = clean_text(full_answer) or clean_text(summary)
+
+    # Skip fatawa without a ruling before building the rest of the entry
+    if not ruling:
+        return None
+
+    title = clean_text(title)
+    question = clean_text(question)
 
     # Extract topics
     topics = extract_topics_from_title(title)
@@ -126,8 +175,46 @@ def convert_fatwa(row: Dict) -> Dict:
     return entry
 
 
+def convert_row(fields: Tuple[str, ...]) -> Optional[Dict]:
+    """Convert one CSV row in a worker process, returning None on failure or no ruling"""
+    try:
+        return convert_fatwa(fields)
+    except Exception as e:
+        print(f"\nError converting fatwa {fields[0]}: {e}")
+        return None
+
+
+def iter_row_fields(reader: Iterator[List[str]], get_fields: itemgetter, width: int) -> Iterator[Tuple[str, ...]]:
+    """Yield the CSV_COLUMNS values of each row, treating missing trailing fields as empty"""
+    for row in reader:
+        if len(row) < width:
+            row += [''] * (width - len(row))
+        yield get_fields(row)
+
+
+def write_json(output_file: Path, data: List[Dict], pretty: bool = False):
+    """Write data as compact JSON, or indented JSON when pretty is set"""
+    if orjson:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+        output_file.write_bytes(orjson.dumps(data, option=option))
+    else:
+        with open(output_file, 'w', encoding='utf-8') as f:
+            if pretty:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            else:
+                json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+
+
 def main():
     """Main conversion function"""
+    parser = argparse.ArgumentParser(description="Convert IslamQA fatawa to FiqhEntry schema")
+    parser.add_argument(
+        '--pretty',
+        action='store_true',
+        help="Also write an indented islamqa_fatawa.pretty.json for reading",
+    )
+    args = parser.parse_args()
+
     print("="*60)
     print("IslamQA Dataset Converter")
     print("Converting IslamQA fatawa to FiqhEntry schema")
@@ -140,31 +227,41 @@ def main():
     # Create output directory
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
-    # Read CSV
+    # Read CSV lazily, picking the needed columns by index
     print(f"\nReading {ISLAMQA_FILE}...")
-    fatawa = []
-
-    with open(ISLAMQA_FILE, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        rows = list(reader)
+    entries = []
+    row_count = 0
 
-    print(f"Found {len(rows)} fatawa")
+    with open(ISLAMQA_FILE, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
 
-    # Convert each fatwa
-    entries = []
-    for row in tqdm(rows, desc="Converting fatawa"):
         try:
-            entry = convert_fatwa(row)
-            if entry['ruling']:  # Only include if we have a ruling
-                entries.append(entry)
-        except Exception as e:
-            print(f"\nError converting fatwa {row.get('رقم السؤال')}: {e}")
-            continue
-
-    # Save output
+            indices = [header.index(column) for column in CSV_COLUMNS]
+        except ValueError as e:
+            print(f"Error: IslamQA CSV is missing an expected column: {e}")
+            return
+        get_fields = itemgetter(*indices)
+        width = max(indices) + 1
+
+        # Convert fatawa across all cores; imap keeps the CSV order
+        with mp.Pool(os.cpu_count()) as pool:
+            converted = pool.imap(convert_row, iter_row_fields(reader, get_fields, width), chunksize=1000)
+            for entry in tqdm(converted, desc="Converting fatawa"):
+                row_count += 1
+                if entry is not None:  # Only include if we have a ruling
+                    entries.append(entry)
+
+    print(f"Found {row_count} fatawa")
+
+    # Save output (compact; optional indented copy for humans)
     output_file = OUTPUT_DIR / 'islamqa_fatawa.json'
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(entries, f, ensure_ascii=False, indent=2)
+    write_json(output_file, entries)
+
+    if args.pretty:
+        pretty_file = OUTPUT_DIR / 'islamqa_fatawa.pretty.json'
+        write_json(pretty_file, entries, pretty=True)
+        print(f"Pretty-printed copy: {pretty_file}")
 
     print("\n" + "="*60)
     print("Conversion Complete!")
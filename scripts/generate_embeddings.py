@@ -3,16 +3,28 @@
 Script to generate embeddings for fiqh entries and store in ChromaDB
 """
 
+import argparse
+import asyncio
 import json
 import os
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 from tqdm import tqdm
 import chromadb
 from chromadb.config import Settings
-from openai import OpenAI
+from openai import AsyncOpenAI
+from aiolimiter import AsyncLimiter
 from dotenv import load_dotenv
-import time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
 
 # Load environment variables
 load_dotenv()
@@ -26,10 +38,25 @@ CHROMA_DIR = DATA_DIR / 'embeddings' / 'chroma_db'
 EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'text-embedding-3-small')
 CHROMA_COLLECTION = os.getenv('CHROMA_COLLECTION', 'fiqh_embeddings')
 BATCH_SIZE = 100  # Process embeddings in batches
+CONCURRENT_REQUESTS = 8  # Batches in flight at once
+REQUESTS_PER_MINUTE = 3000  # OpenAI embeddings rate limit
+CHROMA_FLUSH_SIZE = 2000  # Entries buffered per ChromaDB upsert
+
+# Local (--local) embedding configuration
+LOCAL_EMBEDDING_MODEL = os.getenv('LOCAL_EMBEDDING_MODEL', 'intfloat/multilingual-e5-small')
+LOCAL_CHROMA_COLLECTION = os.getenv('LOCAL_CHROMA_COLLECTION', 'fiqh_embeddings_local')
+LOCAL_MODEL_DIR = DATA_DIR / 'models' / LOCAL_EMBEDDING_MODEL.split('/')[-1]
+LOCAL_QUANTIZATION = 'avx2'  # ONNX Runtime int8 dynamic quantization target
+LOCAL_BATCH_SIZE = 1024  # Entries per ChromaDB insert
+LOCAL_ENCODE_BATCH_SIZE = 256  # Texts per ONNX forward pass
 
 
 def load_fiqh_database() -> List[Dict]:
-    """Load the processed fiqh database"""
+    """Load the processed fiqh database
+
+    With pysimdjson installed, entries are returned as lazy proxies so only
+    the fields read by prepare_entry are materialized.
+    """
     print(f"Loading fiqh database from {PROCESSED_DATA_FILE}")
 
     if not PROCESSED_DATA_FILE.exists():
@@ -38,59 +65,136 @@ def load_fiqh_database() -> List[Dict]:
             "Please run process_texts.py first to create the database."
         )
 
-    with open(PROCESSED_DATA_FILE, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    with open(PROCESSED_DATA_FILE, 'rb') as f:
+        raw = f.read()
+
+    if simdjson:
+        data = simdjson.Parser().parse(raw)
+    else:
+        data = orjson.loads(raw) if orjson else json.loads(raw)
 
     print(f"Loaded {len(data)} entries")
     return data
 
 
-def create_embedding_text(entry: Dict) -> str:
-    """Create a combined text for embedding"""
+def prepare_entry(entry: Dict) -> Tuple[str, str, str, Dict]:
+    """Build an entry's id, embedding text, stored document and metadata in one pass"""
+    get = entry.get
+    ruling = get('ruling', '')
+    question = get('question')
+    topics = get('topics', [])
+    madhab = get('madhab')
+    authenticity = get('authenticity')
+    source = get('source') or {}
+
+    # Create a combined text for embedding
     parts = []
 
     # Add question for fatawa
-    if entry.get('question'):
-        parts.append(f"Question: {entry['question']}")
+    if question:
+        parts.append(f"Question: {question}")
 
     # Add the ruling/content
-    parts.append(entry.get('ruling', ''))
+    parts.append(ruling)
 
     # Add evidence
-    evidence = entry.get('evidence', [])
+    evidence = get('evidence', [])
     if evidence:
         parts.append(f"Evidence: {' | '.join(evidence)}")
 
     # Add topics for context
-    topics = entry.get('topics', [])
     if topics:
         parts.append(f"Topics: {', '.join(topics)}")
 
     # Add madhab for context
-    madhab = entry.get('madhab')
     if madhab and madhab != 'general':
         parts.append(f"Madhab: {madhab}")
 
-    return '\n\n'.join(parts)
+    # Prepare metadata (ChromaDB has limitations on metadata)
+    metadata = {
+        'type': get('type', 'unknown'),
+        'source_title': source.get('title', ''),
+        'source_ref': source.get('reference', ''),
+        'topics': ','.join(topics),
+    }
+
+    # Add optional fields
+    if madhab:
+        metadata['madhab'] = madhab
 
+    if authenticity:
+        metadata['authenticity'] = authenticity
 
-def generate_embeddings_openai(texts: List[str], client: OpenAI) -> List[List[float]]:
+    if question:
+        metadata['question'] = question[:200]  # Truncate
+
+    # Store truncated text as the document
+    return entry['id'], '\n\n'.join(parts), ruling[:1000], metadata
+
+
+async def generate_embeddings_openai(
+    texts: List[str],
+    client: AsyncOpenAI,
+    limiter: AsyncLimiter,
+) -> List[List[float]]:
     """Generate embeddings using OpenAI API"""
+    # Only send each distinct text once (e.g. short rulings shared by several entries)
+    unique_texts = list(dict.fromkeys(texts))
+
     try:
-        response = client.embeddings.create(
-            model=EMBEDDING_MODEL,
-            input=texts
-        )
+        async with limiter:
+            response = await client.embeddings.create(
+                model=EMBEDDING_MODEL,
+                input=unique_texts
+            )
 
-        embeddings = [item.embedding for item in response.data]
-        return embeddings
+        embedding_by_text = dict(zip(unique_texts, (item.embedding for item in response.data)))
+        return [embedding_by_text[text] for text in texts]
 
     except Exception as e:
         print(f"Error generating embeddings: {e}")
         raise
 
 
-def setup_chromadb() -> tuple:
+def load_local_model():
+    """Load the local embedding model as an int8-quantized ONNX model
+
+    The model is exported and quantized on first use and cached under
+    LOCAL_MODEL_DIR.
+    """
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    quantized_file = f"onnx/model_qint8_{LOCAL_QUANTIZATION}.onnx"
+
+    if not (LOCAL_MODEL_DIR / quantized_file).exists():
+        print(f"Exporting {LOCAL_EMBEDDING_MODEL} to ONNX (int8, {LOCAL_QUANTIZATION})...")
+        model = SentenceTransformer(LOCAL_EMBEDDING_MODEL, backend='onnx')
+        model.save_pretrained(str(LOCAL_MODEL_DIR))
+        export_dynamic_quantized_onnx_model(model, LOCAL_QUANTIZATION, str(LOCAL_MODEL_DIR))
+
+    return SentenceTransformer(
+        str(LOCAL_MODEL_DIR),
+        backend='onnx',
+        model_kwargs={'file_name': quantized_file},
+    )
+
+
+def generate_embeddings_local(texts: List[str], model) -> List[List[float]]:
+    """Generate embeddings with the local ONNX model"""
+    unique_texts = list(dict.fromkeys(texts))
+
+    # E5 models expect a "passage: " prefix on documents
+    embeddings = model.encode(
+        [f"passage: {text}" for text in unique_texts],
+        batch_size=LOCAL_ENCODE_BATCH_SIZE,
+        normalize_embeddings=True,
+    )
+
+    embedding_by_text = dict(zip(unique_texts, embeddings.tolist()))
+    return [embedding_by_text[text] for text in texts]
+
+
+def setup_chromadb(collection_name: str = CHROMA_COLLECTION) -> tuple:
     """Set up ChromaDB client and collection"""
     print(f"\nSetting up ChromaDB...")
     print(f"Storage directory: {CHROMA_DIR}")
@@ -107,94 +211,194 @@ def setup_chromadb() -> tuple:
     # Get or create collection
     try:
         # Try to get existing collection
-        collection = client.get_collection(name=CHROMA_COLLECTION)
-        print(f"Found existing collection '{CHROMA_COLLECTION}' with {collection.count()} entries")
+        collection = client.get_collection(name=collection_name)
+        print(f"Found existing collection '{collection_name}' with {collection.count()} entries")
 
         # Ask user if they want to reset
         response = input("Do you want to reset the collection? (y/N): ")
         if response.lower() == 'y':
-            client.delete_collection(name=CHROMA_COLLECTION)
-            collection = client.create_collection(name=CHROMA_COLLECTION)
+            client.delete_collection(name=collection_name)
+            collection = client.create_collection(name=collection_name)
             print("Collection reset")
         else:
             print("Using existing collection")
 
     except Exception:
         # Collection doesn't exist, create it
-        collection = client.create_collection(name=CHROMA_COLLECTION)
-        print(f"Created new collection '{CHROMA_COLLECTION}'")
+        collection = client.create_collection(name=collection_name)
+        print(f"Created new collection '{collection_name}'")
 
     return client, collection
 
 
 def add_to_chromadb(
     collection,
-    entries: List[Dict],
+    ids: List[str],
     embeddings: List[List[float]],
+    documents: List[str],
+    metadatas: List[Dict],
 ):
-    """Add entries and embeddings to ChromaDB"""
-    ids = [entry['id'] for entry in entries]
-    documents = [entry.get('ruling', '')[:1000] for entry in entries]  # Store truncated text
+    """Upsert prepared entries and embeddings to ChromaDB"""
+    # Upsert to collection (re-running over existing ids is not an error)
+    collection.upsert(
+        ids=ids,
+        embeddings=embeddings,
+        documents=documents,
+        metadatas=metadatas
+    )
 
-    # Prepare metadata (ChromaDB has limitations on metadata)
-    metadatas = []
-    for entry in entries:
-        metadata = {
-            'type': entry.get('type', 'unknown'),
-            'source_title': entry.get('source', {}).get('title', ''),
-            'source_ref': entry.get('source', {}).get('reference', ''),
-            'topics': ','.join(entry.get('topics', [])),
-        }
 
-        # Add optional fields
-        if entry.get('madhab'):
-            metadata['madhab'] = entry['madhab']
+def buffer_for_chromadb(
+    pending: Dict[str, list],
+    ids: Tuple[str, ...],
+    embeddings: List[List[float]],
+    documents: Tuple[str, ...],
+    metadatas: Tuple[Dict, ...],
+) -> int:
+    """Append a batch to the column buffers and return the number of buffered entries"""
+    pending['ids'].extend(ids)
+    pending['embeddings'].extend(embeddings)
+    pending['documents'].extend(documents)
+    pending['metadatas'].extend(metadatas)
+    return len(pending['ids'])
+
+
+def flush_to_chromadb(collection, pending: Dict[str, list]):
+    """Write the buffered columns to ChromaDB and clear the buffers"""
+    if not pending['ids']:
+        return
 
-        if entry.get('authenticity'):
-            metadata['authenticity'] = entry['authenticity']
+    add_to_chromadb(collection, **pending)
 
-        if entry.get('question'):
-            metadata['question'] = entry['question'][:200]  # Truncate
+    # Clear only after a successful write, so a failed flush can be retried
+    for column in pending.values():
+        column.clear()
 
-        metadatas.append(metadata)
 
-    # Add to collection
-    collection.add(
-        ids=ids,
-        embeddings=embeddings,
-        documents=documents,
-        metadatas=metadatas
-    )
+def flush_remaining(collection, pending: Dict[str, list]):
+    """Final flush that reports, rather than raises, a failed ChromaDB write"""
+    try:
+        flush_to_chromadb(collection, pending)
+    except Exception as e:
+        print(f"\nError saving to ChromaDB: {e}")
+        print(f"{len(pending['ids'])} embedded entries were not stored. Re-run to retry them.")
+
+
+async def embed_entries(entries: List[Dict], client: AsyncOpenAI, collection):
+    """Embed entries with several batches in flight and store them in ChromaDB"""
+    limiter = AsyncLimiter(REQUESTS_PER_MINUTE, 60)
+    batches = [entries[i:i + BATCH_SIZE] for i in range(0, len(entries), BATCH_SIZE)]
+
+    # Buffer several batches per ChromaDB write to amortize transaction overhead.
+    # Columns are kept separately so a flush passes them straight to upsert.
+    pending = {'ids': [], 'embeddings': [], 'documents': [], 'metadatas': []}
+
+    try:
+        with tqdm(total=len(batches), desc="Batches") as progress:
+            for start in range(0, len(batches), CONCURRENT_REQUESTS):
+                window = batches[start:start + CONCURRENT_REQUESTS]
+                prepared = [tuple(zip(*map(prepare_entry, batch))) for batch in window]
+
+                # Request embeddings for the whole window concurrently
+                results = await asyncio.gather(
+                    *[
+                        generate_embeddings_openai(list(texts), client, limiter)
+                        for _, texts, _, _ in prepared
+                    ],
+                    return_exceptions=True,
+                )
+
+                # Add to ChromaDB in batch order
+                for offset, ((ids, _, documents, metadatas), embeddings) in enumerate(
+                    zip(prepared, results)
+                ):
+                    try:
+                        if isinstance(embeddings, BaseException):
+                            raise embeddings
+
+                        buffered = buffer_for_chromadb(pending, ids, embeddings, documents, metadatas)
+                        if buffered >= CHROMA_FLUSH_SIZE:
+                            flush_to_chromadb(collection, pending)
+                        progress.update(1)
+
+                    except Exception as e:
+                        print(f"\nError processing batch {start + offset + 1}: {e}")
+                        print("Stopping to avoid data loss. You can re-run to continue from this point.")
+                        return
+    finally:
+        # Keep everything embedded so far, even when stopping early
+        flush_remaining(collection, pending)
+
+
+def embed_entries_local(entries: List[Dict], model, collection):
+    """Embed entries with the local model and store them in ChromaDB"""
+    pending = {'ids': [], 'embeddings': [], 'documents': [], 'metadatas': []}
+
+    try:
+        for i in tqdm(range(0, len(entries), LOCAL_BATCH_SIZE), desc="Batches"):
+            batch = entries[i:i + LOCAL_BATCH_SIZE]
+            ids, texts, documents, metadatas = zip(*map(prepare_entry, batch))
+
+            try:
+                embeddings = generate_embeddings_local(list(texts), model)
+
+                buffered = buffer_for_chromadb(pending, ids, embeddings, documents, metadatas)
+                if buffered >= CHROMA_FLUSH_SIZE:
+                    flush_to_chromadb(collection, pending)
+
+            except Exception as e:
+                print(f"\nError processing batch {i//LOCAL_BATCH_SIZE + 1}: {e}")
+                print("Stopping to avoid data loss. You can re-run to continue from this point.")
+                break
+    finally:
+        flush_remaining(collection, pending)
 
 
 def main():
     """Main function to generate embeddings"""
+    parser = argparse.ArgumentParser(description="Generate embeddings for fiqh entries")
+    parser.add_argument(
+        '--local',
+        action='store_true',
+        help=f"Embed with a local int8 ONNX model ({LOCAL_EMBEDDING_MODEL}) instead of OpenAI",
+    )
+    args = parser.parse_args()
+
     print(f"\n{'='*60}")
     print("Fiqh Embeddings Generator")
     print(f"{'='*60}")
 
-    # Check for OpenAI API key
-    openai_key = os.getenv('OPENAI_API_KEY')
-    if not openai_key:
-        raise ValueError(
-            "OPENAI_API_KEY not found in environment.\n"
-            "Please set it in your .env file or environment variables."
-        )
-
-    # Initialize OpenAI client
-    client = OpenAI(api_key=openai_key)
-    print(f"Using embedding model: {EMBEDDING_MODEL}")
+    if args.local:
+        # Local vectors live in their own collection: they are not
+        # comparable with the OpenAI vectors the MCP server queries with
+        model = load_local_model()
+        collection_name = LOCAL_CHROMA_COLLECTION
+        print(f"Using local embedding model: {LOCAL_EMBEDDING_MODEL}")
+    else:
+        # Check for OpenAI API key
+        openai_key = os.getenv('OPENAI_API_KEY')
+        if not openai_key:
+            raise ValueError(
+                "OPENAI_API_KEY not found in environment.\n"
+                "Please set it in your .env file or environment variables."
+            )
+
+        # Initialize OpenAI client
+        client = AsyncOpenAI(api_key=openai_key)
+        collection_name = CHROMA_COLLECTION
+        print(f"Using embedding model: {EMBEDDING_MODEL}")
 
     # Load database
     entries = load_fiqh_database()
 
     # Set up ChromaDB
-    chroma_client, collection = setup_chromadb()
+    chroma_client, collection = setup_chromadb(collection_name)
 
-    # Get existing IDs to skip already embedded entries
+    # Get existing IDs to skip already embedded entries (ids only, so the
+    # scan stays cheap; upsert handles any overlap)
     existing_ids = set()
     try:
-        existing = collection.get()
+        existing = collection.get(include=[])
         existing_ids = set(existing['ids'])
         print(f"Found {len(existing_ids)} existing embeddings")
     except Exception:
@@ -208,29 +412,14 @@ def main():
         return
 
     print(f"\nGenerating embeddings for {len(entries_to_process)} entries...")
-    print(f"Processing in batches of {BATCH_SIZE}")
 
     # Process in batches
-    for i in tqdm(range(0, len(entries_to_process), BATCH_SIZE), desc="Batches"):
-        batch = entries_to_process[i:i + BATCH_SIZE]
-
-        # Create embedding texts
-        texts = [create_embedding_text(entry) for entry in batch]
-
-        # Generate embeddings
-        try:
-            embeddings = generate_embeddings_openai(texts, client)
-
-            # Add to ChromaDB
-            add_to_chromadb(collection, batch, embeddings)
-
-            # Rate limiting
-            time.sleep(0.5)
-
-        except Exception as e:
-            print(f"\nError processing batch {i//BATCH_SIZE + 1}: {e}")
-            print("Stopping to avoid data loss. You can re-run to continue from this point.")
-            break
+    if args.local:
+        print(f"Processing in batches of {LOCAL_BATCH_SIZE}")
+        embed_entries_local(entries_to_process, model, collection)
+    else:
+        print(f"Processing in batches of {BATCH_SIZE} ({CONCURRENT_REQUESTS} concurrent requests)")
+        asyncio.run(embed_entries(entries_to_process, client, collection))
 
     # Print summary
     final_count = collection.count()
@@ -239,7 +428,7 @@ def main():
     print(f"{'='*60}")
     print(f"Total embeddings in database: {final_count}")
     print(f"ChromaDB location: {CHROMA_DIR}")
-    print(f"Collection name: {CHROMA_COLLECTION}")
+    print(f"Collection name: {collection_name}")
 
 
 if __name__ == '__main__':
@@ -5,140 +5,256 @@ Cleans, validates, and combines hadith and fatawa into a single database
 """
 
 import json
+import os
 import re
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
 from tqdm import tqdm
+import ahocorasick
 import uuid
 
+from _patterns import ENTITY_MAP, ENTITY_RE, EVIDENCE_RE, HADITH_NUMBER_RE, QUOTE_TRANS, TAG_RE, WS_RE
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard as zstd
+except ImportError:
+    zstd = None
+
 # Paths
 RAW_DATA_DIR = Path(__file__).parent.parent / 'data' / 'raw'
 PROCESSED_DATA_DIR = Path(__file__).parent.parent / 'data' / 'processed'
 OUTPUT_FILE = PROCESSED_DATA_DIR / 'fiqh_database.json'
+COMPRESSED_OUTPUT_FILE = PROCESSED_DATA_DIR / 'fiqh_database.json.zst'
 SOURCES_FILE = PROCESSED_DATA_DIR / 'sources.json'
 
+# Characters that mean text needs more than whitespace cleanup: HTML tags,
+# entities and the curly quotes in QUOTE_TRANS
+MARKUP_CHARS = ('<', '&', '\u201c', '\u201d', '\u2018', '\u2019')
+
+# zstd level for the compressed database copy
+ZSTD_LEVEL = 10
+
+# Longest text memoized by clean_text
+CLEAN_CACHE_MAX_LEN = 256
+
+# Common topic normalizations
+TOPIC_NORMALIZATIONS = {
+    'salah': 'prayer',
+    'salat': 'prayer',
+    'namaz': 'prayer',
+    'salaah': 'prayer',
+    'wudhu': 'wudu',
+    'wudoo': 'wudu',
+    'zakah': 'zakat',
+    'zakaah': 'zakat',
+    'sawm': 'fasting',
+    'siyam': 'fasting',
+    'hajj': 'pilgrimage',
+    'nikah': 'marriage',
+    'talaaq': 'divorce',
+    'talaq': 'divorce',
+}
+
+# Lowercase literals that every EVIDENCE_RE alternative starts with
+EVIDENCE_KEYWORDS = [
+    'surah', 'chapter', 'quran', 'al-quran', '[',
+    'bukhari', 'muslim', 'tirmidhi', 'abu dawud', 'ibn majah', 'nasai', 'sahih',
+]
+
+
+def build_keyword_automaton(keywords: List[str]) -> ahocorasick.Automaton:
+    """Build an Aho-Corasick automaton mapping each keyword to its length"""
+    automaton = ahocorasick.Automaton()
+    for keyword in keywords:
+        automaton.add_word(keyword, len(keyword))
+    automaton.make_automaton()
+    return automaton
+
+
+EVIDENCE_AUTOMATON = build_keyword_automaton(EVIDENCE_KEYWORDS)
+
+
+def replace_entity(match: re.Match) -> str:
+    """Decode a matched HTML entity, or drop a matched HTML tag"""
+    return ENTITY_MAP.get(match.group(1), '')
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace, decode entities, strip tags and normalize quotes"""
+    # Remove excessive whitespace
+    text = WS_RE.sub(' ', text)
+
+    # Fast path: nothing left to decode, strip or translate
+    if not any(marker in text for marker in MARKUP_CHARS):
+        return text.strip()
+
+    # Decode HTML entities and remove HTML tags
+    text = ENTITY_RE.sub(replace_entity, text)
+
+    # Escaped markup (&lt;b&gt;) only becomes a tag once decoded
+    if '<' in text:
+        text = TAG_RE.sub('', text)
+
+    # Normalize quotes and trim
+    return text.translate(QUOTE_TRANS).strip()
+
+
+# Memoized variant for short fragments (narrator names, chapter headers, ...)
+# that repeat across collections; long rulings are nearly always unique
+normalize_text_cached = lru_cache(maxsize=200_000)(normalize_text)
+
 
 def clean_text(text: str) -> str:
     """Clean and normalize text"""
     if not text:
         return ""
 
-    # Remove excessive whitespace
-    text = re.sub(r'\s+', ' ', text)
-
-    # Remove HTML entities
-    text = text.replace('&nbsp;', ' ')
-    text = text.replace('&quot;', '"')
-    text = text.replace('&amp;', '&')
-    text = text.replace('&lt;', '<')
-    text = text.replace('&gt;', '>')
+    if len(text) <= CLEAN_CACHE_MAX_LEN:
+        return normalize_text_cached(text)
 
-    # Remove remaining HTML tags
-    text = re.sub(r'<[^>]+>', '', text)
+    return normalize_text(text)
 
-    # Normalize quotes
-    text = text.replace('"', '"').replace('"', '"')
-    text = text.replace(''', "'").replace(''', "'")
 
-    # Trim
-    text = text.strip()
+def iter_evidence_matches(text: str, starts: Iterable[int]) -> Iterator[re.Match]:
+    """Yield non-overlapping EVIDENCE_RE matches, trying the regex only at the given starts"""
+    pos = 0
+    for start in starts:
+        if start < pos:  # Inside the previous match
+            continue
+        match = EVIDENCE_RE.match(text, start)
+        if not match:
+            continue
+        yield match
+        pos = match.end()
 
-    return text
+        # "Sahih Bukhari 55" also cites the numbered hadith "Bukhari 55"
+        collection_start = match.start('collection')
+        if collection_start >= 0:
+            numbered = HADITH_NUMBER_RE.match(text, collection_start)
+            if numbered:
+                yield numbered
+                pos = max(pos, numbered.end())
 
 
 def extract_evidence_from_text(text: str) -> List[str]:
     """Extract Quran and hadith references from text"""
-    evidence = []
-
-    # Look for Quran references
-    quran_patterns = [
-        r'(?:Surah|Chapter)\s+[\w-]+\s*[:,]\s*(?:Ayah|Verse)\s+\d+',
-        r'(?:Quran|Al-Quran)\s+\d+:\d+',
-        r'\[\d+:\d+\]'
-    ]
-
-    for pattern in quran_patterns:
-        matches = re.finditer(pattern, text, re.IGNORECASE)
-        for match in matches:
-            evidence.append(clean_text(match.group()))
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        # Only positions where a reference keyword starts can begin a match
+        starts = sorted({end - length + 1 for end, length in EVIDENCE_AUTOMATON.iter(lowered)})
+    else:  # Lowercasing changed offsets, so find starts with the regex directly
+        starts = [match.start() for match in EVIDENCE_RE.finditer(text)]
+    matches = iter_evidence_matches(text, starts)
 
-    # Look for hadith references
-    hadith_patterns = [
-        r'(?:Bukhari|Muslim|Tirmidhi|Abu Dawud|Ibn Majah|Nasai)\s+\d+',
-        r'Sahih\s+(?:Bukhari|Muslim)',
-    ]
+    # Deduplicate while iterating, keeping first-seen order
+    evidence = dict.fromkeys(clean_text(match.group()) for match in matches)
 
-    for pattern in hadith_patterns:
-        matches = re.finditer(pattern, text, re.IGNORECASE)
-        for match in matches:
-            evidence.append(clean_text(match.group()))
-
-    return list(set(evidence))  # Remove duplicates
+    return list(evidence)
 
 
+@lru_cache(maxsize=1024)
 def normalize_topic(topic: str) -> str:
     """Normalize topic names"""
-    topic = topic.lower().strip()
-
-    # Common normalizations
-    normalizations = {
-        'salah': 'prayer',
-        'salat': 'prayer',
-        'namaz': 'prayer',
-        'salaah': 'prayer',
-        'wudhu': 'wudu',
-        'wudoo': 'wudu',
-        'zakah': 'zakat',
-        'zakaah': 'zakat',
-        'sawm': 'fasting',
-        'siyam': 'fasting',
-        'hajj': 'pilgrimage',
-        'nikah': 'marriage',
-        'talaaq': 'divorce',
-        'talaq': 'divorce',
+    topic = topic.strip().lower()
+    return TOPIC_NORMALIZATIONS.get(topic, topic)
+
+
+def loads(data: bytes) -> Any:
+    """Parse JSON bytes with orjson when available"""
+    return orjson.loads(data) if orjson else json.loads(data)
+
+
+def dumps(data: Any) -> bytes:
+    """Serialize data to compact UTF-8 JSON bytes"""
+    if orjson:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+def load_entries(file_path: Path) -> List[Dict]:
+    """Load entries from a JSON array file or a JSON Lines (.jsonl) file"""
+    if file_path.suffix == '.jsonl':
+        with open(file_path, 'rb') as f:
+            return [loads(line) for line in f if line.strip()]
+    return loads(file_path.read_bytes())
+
+
+def write_json(output_file: Path, data: Any):
+    """Write data as indented UTF-8 JSON"""
+    if orjson:
+        output_file.write_bytes(
+            orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        )
+    else:
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def build_hadith(hadith: Dict) -> Optional[Dict]:
+    """Build a processed hadith entry, or None if its ruling is too short"""
+    # Clean ruling text
+    ruling = clean_text(hadith.get('ruling', ''))
+    if not ruling or len(ruling) < 20:  # Skip very short entries
+        return None
+
+    # Process topics
+    topics = [normalize_topic(t) for t in hadith.get('topics', [])] or ['general']
+
+    # Extract additional evidence if not present
+    evidence = hadith.get('evidence') or extract_evidence_from_text(ruling)
+
+    return {
+        'id': hadith['id'] if 'id' in hadith else str(uuid.uuid4()),
+        'type': 'hadith',
+        'ruling': ruling,
+        'arabicText': clean_text(hadith.get('arabicText', '')),
+        'evidence': evidence,
+        'source': hadith.get('source', {}),
+        'authenticity': hadith.get('authenticity', 'unknown'),
+        'topics': topics,
+        'madhab': None,  # Hadith are pre-madhab
     }
 
-    return normalizations.get(topic, topic)
+
+def build_fatwa(fatwa: Dict) -> Optional[Dict]:
+    """Build a processed fatwa entry, or None if its ruling is too short"""
+    # Clean texts
+    ruling = clean_text(fatwa.get('ruling', ''))
+    if not ruling or len(ruling) < 50:  # Skip very short entries
+        return None
+
+    # Process topics
+    topics = [normalize_topic(t) for t in fatwa.get('topics', [])] or ['general']
+
+    # Extract evidence from ruling if not present
+    evidence = fatwa.get('evidence') or extract_evidence_from_text(ruling)
+
+    return {
+        'id': fatwa['id'] if 'id' in fatwa else str(uuid.uuid4()),
+        'type': 'fatwa',
+        'question': clean_text(fatwa.get('question', '')),
+        'ruling': ruling,
+        'evidence': evidence,
+        'source': fatwa.get('source', {}),
+        'topics': topics,
+        'madhab': fatwa.get('madhab', 'general'),
+        'date': fatwa.get('date'),
+    }
 
 
 def process_hadith_file(file_path: Path) -> List[Dict]:
-    """Process a hadith JSON file"""
+    """Process a hadith JSON or JSON Lines file"""
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            hadiths = json.load(f)
-
-        processed = []
-        for hadith in hadiths:
-            # Clean ruling text
-            ruling = clean_text(hadith.get('ruling', ''))
-            if not ruling or len(ruling) < 20:  # Skip very short entries
-                continue
-
-            # Process topics
-            topics = [normalize_topic(t) for t in hadith.get('topics', [])]
-            if not topics:
-                topics = ['general']
-
-            # Extract additional evidence if not present
-            evidence = hadith.get('evidence', [])
-            if not evidence:
-                evidence = extract_evidence_from_text(ruling)
-
-            processed_hadith = {
-                'id': hadith.get('id', str(uuid.uuid4())),
-                'type': 'hadith',
-                'ruling': ruling,
-                'arabicText': clean_text(hadith.get('arabicText', '')),
-                'evidence': evidence,
-                'source': hadith.get('source', {}),
-                'authenticity': hadith.get('authenticity', 'unknown'),
-                'topics': topics,
-                'madhab': None,  # Hadith are pre-madhab
-            }
-
-            processed.append(processed_hadith)
-
-        return processed
+        hadiths = load_entries(file_path)
+        return [entry for entry in map(build_hadith, hadiths) if entry is not None]
 
     except Exception as e:
         print(f"Error processing {file_path}: {e}")
@@ -148,56 +264,46 @@ def process_hadith_file(file_path: Path) -> List[Dict]:
 def process_fatwa_file(file_path: Path) -> List[Dict]:
     """Process a fatwa JSON file"""
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            fatawa = json.load(f)
-
-        processed = []
-        for fatwa in fatawa:
-            # Clean texts
-            question = clean_text(fatwa.get('question', ''))
-            ruling = clean_text(fatwa.get('ruling', ''))
-
-            if not ruling or len(ruling) < 50:  # Skip very short entries
-                continue
-
-            # Process topics
-            topics = [normalize_topic(t) for t in fatwa.get('topics', [])]
-            if not topics:
-                topics = ['general']
-
-            # Extract evidence from ruling if not present
-            evidence = fatwa.get('evidence', [])
-            if not evidence:
-                evidence = extract_evidence_from_text(ruling)
-
-            processed_fatwa = {
-                'id': fatwa.get('id', str(uuid.uuid4())),
-                'type': 'fatwa',
-                'question': question,
-                'ruling': ruling,
-                'evidence': evidence,
-                'source': fatwa.get('source', {}),
-                'topics': topics,
-                'madhab': fatwa.get('madhab', 'general'),
-                'date': fatwa.get('date'),
-            }
-
-            processed.append(processed_fatwa)
-
-        return processed
+        fatawa = load_entries(file_path)
+        return [entry for entry in map(build_fatwa, fatawa) if entry is not None]
 
     except Exception as e:
         print(f"Error processing {file_path}: {e}")
         return []
 
 
+# Raw data file extensions; *.pretty.json human-readable copies are skipped
+DATA_FILE_SUFFIXES = ('.json', '.jsonl')
+
+# File processor and sources_info key for each kind of raw data file
+FILE_PROCESSORS = {'hadith': process_hadith_file, 'fatwa': process_fatwa_file}
+SOURCES_KEYS = {'hadith': 'hadith_collections', 'fatwa': 'fatwa_sources'}
+
+
+def walk_json_files(root: Path) -> Iterator[Path]:
+    """Recursively yield JSON/JSON Lines files under root in name order, in a single scandir pass"""
+    with os.scandir(root) as it:
+        dir_entries = sorted(it, key=lambda dir_entry: dir_entry.name)
+
+    for dir_entry in dir_entries:
+        if dir_entry.is_dir():
+            yield from walk_json_files(Path(dir_entry.path))
+        elif dir_entry.name.endswith(DATA_FILE_SUFFIXES) and not dir_entry.name.endswith('.pretty.json'):
+            yield Path(dir_entry.path)
+
+
+def process_file(job: Tuple[Path, str]) -> List[Dict]:
+    """Process one (file, kind) job; runs in a worker process"""
+    file_path, kind = job
+    return FILE_PROCESSORS[kind](file_path)
+
+
 def process_all_data():
     """Process all raw data files"""
     print(f"\n{'='*60}")
     print("Processing Fiqh Data")
     print(f"{'='*60}")
 
-    all_entries = []
     sources_info = {
         'hadith_collections': [],
         'fatwa_sources': [],
@@ -205,75 +311,95 @@ def process_all_data():
         'entries_by_type': {},
     }
 
-    # Process hadith files
+    # Collect (file, kind) pairs; every file is processed independently
+    jobs = []
+
     hadith_dir = RAW_DATA_DIR / 'hadith'
     if hadith_dir.exists():
-        print("\nProcessing hadith collections...")
-        # Process JSON files directly in hadith directory
-        for json_file in hadith_dir.glob('*.json'):
-            print(f"  Processing: {json_file.name}")
-            entries = process_hadith_file(json_file)
-            all_entries.extend(entries)
-            sources_info['hadith_collections'].append({
-                'file': json_file.name,
-                'count': len(entries)
-            })
-        # Also check subdirectories
-        for collection_dir in hadith_dir.iterdir():
-            if collection_dir.is_dir():
-                for json_file in collection_dir.glob('*.json'):
-                    print(f"  Processing: {json_file.name}")
-                    entries = process_hadith_file(json_file)
-                    all_entries.extend(entries)
-                    sources_info['hadith_collections'].append({
-                        'file': json_file.name,
-                        'count': len(entries)
-                    })
-
-    # Process fatwa files
+        for json_file in walk_json_files(hadith_dir):
+            jobs.append((json_file, 'hadith'))
+
     fatwa_dir = RAW_DATA_DIR / 'fatawa'
     if fatwa_dir.exists():
-        print("\nProcessing fatawa...")
-        for json_file in fatwa_dir.glob('*.json'):
-            print(f"  Processing: {json_file.name}")
-            entries = process_fatwa_file(json_file)
-            all_entries.extend(entries)
-            sources_info['fatwa_sources'].append({
-                'file': json_file.name,
-                'count': len(entries)
-            })
-
-    # Calculate statistics
-    sources_info['total_entries'] = len(all_entries)
-
-    type_counts = {}
-    for entry in all_entries:
-        entry_type = entry.get('type', 'unknown')
-        type_counts[entry_type] = type_counts.get(entry_type, 0) + 1
-
-    sources_info['entries_by_type'] = type_counts
+        for json_file in walk_json_files(fatwa_dir):
+            jobs.append((json_file, 'fatwa'))
 
     # Create output directory
     PROCESSED_DATA_DIR.mkdir(parents=True, exist_ok=True)
 
-    # Save processed database
-    print(f"\nSaving processed database...")
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(all_entries, f, ensure_ascii=False, indent=2)
+    # Stream entries into the database array as each file finishes, so only
+    # the files in flight are held in memory. A zstd-compressed copy is
+    # written alongside when zstandard is installed. Both are written to
+    # temporary siblings and moved into place only once complete, so a failed
+    # run never leaves a truncated database where the server loads it.
+    output_paths = [OUTPUT_FILE, COMPRESSED_OUTPUT_FILE] if zstd else [OUTPUT_FILE]
+    temp_paths = [path.with_name(path.name + '.tmp') for path in output_paths]
+    total_entries = 0
+    type_counts = {}
+
+    print(f"\nProcessing {len(jobs)} files...")
+    try:
+        with ExitStack() as stack:
+            outputs = [stack.enter_context(open(temp_paths[0], 'wb'))]
+            if zstd:
+                compressed_file = stack.enter_context(open(temp_paths[1], 'wb'))
+                outputs.append(stack.enter_context(
+                    zstd.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(compressed_file)
+                ))
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers=os.cpu_count()))
+
+            for out in outputs:
+                out.write(b'[')
+
+            for (json_file, kind), entries in zip(jobs, executor.map(process_file, jobs, chunksize=4)):
+                print(f"  Processed: {json_file.name} ({len(entries)} entries)")
+                sources_info[SOURCES_KEYS[kind]].append({
+                    'file': json_file.name,
+                    'count': len(entries)
+                })
+
+                chunk = []
+                for entry in entries:
+                    chunk.append(b',\n' if total_entries else b'\n')
+                    chunk.append(dumps(entry))
+                    total_entries += 1
+
+                    entry_type = entry.get('type', 'unknown')
+                    type_counts[entry_type] = type_counts.get(entry_type, 0) + 1
+
+                data = b''.join(chunk)
+                for out in outputs:
+                    out.write(data)
+
+            for out in outputs:
+                out.write(b'\n]\n')
+    except BaseException:
+        # Leave no partial temporary files behind
+        for temp_path in temp_paths:
+            temp_path.unlink(missing_ok=True)
+        raise
+
+    for temp_path, output_path in zip(temp_paths, output_paths):
+        os.replace(temp_path, output_path)
+
+    # Record statistics
+    sources_info['total_entries'] = total_entries
+    sources_info['entries_by_type'] = type_counts
 
     # Save sources info
-    with open(SOURCES_FILE, 'w', encoding='utf-8') as f:
-        json.dump(sources_info, f, ensure_ascii=False, indent=2)
+    write_json(SOURCES_FILE, sources_info)
 
     print(f"\n{'='*60}")
     print("Processing Complete!")
     print(f"{'='*60}")
-    print(f"Total entries processed: {len(all_entries)}")
+    print(f"Total entries processed: {total_entries}")
     print(f"Entries by type:")
     for entry_type, count in type_counts.items():
         print(f"  - {entry_type}: {count}")
     print(f"\nOutput files:")
     print(f"  - Database: {OUTPUT_FILE}")
+    if zstd:
+        print(f"  - Compressed database: {COMPRESSED_OUTPUT_FILE}")
     print(f"  - Sources: {SOURCES_FILE}")
 
 
@@ -5,13 +5,19 @@ Note: This is a basic scraper. For production, check robots.txt and rate limits.
 """
 
 import requests
-from bs4 import BeautifulSoup
+from selectolax.parser import HTMLParser
 import json
-import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import List, Dict, Optional
 from tqdm import tqdm
 
+from _http import (
+    MAX_WORKERS, RATE_LIMIT_CALLS, RATE_LIMIT_PERIOD,
+    RateLimiter, create_session, retry_transient,
+)
+from _patterns import WS_RE
+
 # Output directory
 OUTPUT_DIR = Path(__file__).parent.parent / 'data' / 'raw' / 'fatawa'
 
@@ -22,40 +28,83 @@ ISLAMQA_BASE = "https://islamqa.info/en/answers"
 # These are real fatwa IDs from islamqa.info
 SAMPLE_FATWA_IDS = list(range(1, 100))  # Start with first 100
 
+# Pages are truncated here; the article content is well within this
+MAX_PAGE_BYTES = 2 * 1024 * 1024
+
+
+def is_cacheable_page(response: requests.Response) -> bool:
+    """Cache a page only if its declared size is within MAX_PAGE_BYTES
+
+    requests-cache reads the whole body of anything it stores, so pages of
+    unknown or excessive size are left uncached and read capped instead.
+    """
+    if response.status_code != 200:
+        return True
+    length = response.headers.get('Content-Length', '')
+    return length.isdigit() and int(length) <= MAX_PAGE_BYTES
+
+
+# Shared across all worker threads so connections are reused and the
+# request rate is limited in aggregate
+SESSION = create_session(filter_fn=is_cacheable_page)
+RATE_LIMITER = RateLimiter(RATE_LIMIT_CALLS, RATE_LIMIT_PERIOD)
+
+
+@retry_transient
+def fetch_page(url: str) -> Optional[bytes]:
+    """Fetch up to MAX_PAGE_BYTES of a page, retrying transient failures; None if it doesn't exist"""
+    # Only cache misses and expired entries count against the rate limit
+    response = SESSION.get(url, timeout=30, only_if_cached=True)
+    if response.status_code == 504:
+        RATE_LIMITER.wait()
+        response = SESSION.get(url, timeout=30, stream=True)
+
+    with response:
+        # Skip if page doesn't exist
+        if response.status_code == 404:
+            return None
+
+        response.raise_for_status()
+
+        # Read in chunks, stopping once the size cap is passed
+        content = bytearray()
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            content += chunk
+            if len(content) > MAX_PAGE_BYTES:
+                print(f"Warning: truncated {url} to {MAX_PAGE_BYTES} bytes")
+                break
+
+    return bytes(content[:MAX_PAGE_BYTES])
+
 
 def fetch_fatwa(fatwa_id: int) -> Optional[Dict]:
     """Fetch a single fatwa from IslamQA"""
     url = f"{ISLAMQA_BASE}/{fatwa_id}"
 
     try:
-        response = requests.get(url, timeout=30)
+        content = fetch_page(url)
 
         # Skip if fatwa doesn't exist
-        if response.status_code == 404:
+        if content is None:
             return None
 
-        response.raise_for_status()
-
         # Parse HTML
-        soup = BeautifulSoup(response.content, 'html.parser')
+        tree = HTMLParser(content)
 
         # Extract question
-        question_elem = soup.find('h1', class_='article-title')
-        question = question_elem.get_text(strip=True) if question_elem else ''
+        question_elem = tree.css_first('h1.article-title')
+        question = WS_RE.sub(' ', question_elem.text(strip=True)) if question_elem else ''
 
         # Extract answer/ruling
-        answer_elem = soup.find('div', class_='article-content')
-        ruling = answer_elem.get_text(separator='\n', strip=True) if answer_elem else ''
+        answer_elem = tree.css_first('div.article-content')
+        ruling = answer_elem.text(separator='\n', strip=True) if answer_elem else ''
 
         # Extract reference number
-        ref_elem = soup.find('span', class_='article-number')
-        ref_num = ref_elem.get_text(strip=True) if ref_elem else str(fatwa_id)
+        ref_elem = tree.css_first('span.article-number')
+        ref_num = ref_elem.text(strip=True) if ref_elem else str(fatwa_id)
 
         # Extract topics/tags
-        topics = []
-        topic_elems = soup.find_all('a', class_='tag')
-        for topic_elem in topic_elems:
-            topics.append(topic_elem.get_text(strip=True).lower())
+        topics = [WS_RE.sub(' ', topic_elem.text(strip=True)).lower() for topic_elem in tree.css('a.tag')]
 
         # Build fatwa entry
         fatwa = {
@@ -94,19 +143,15 @@ def scrape_fatawa(fatwa_ids: List[int]):
     # Create output directory
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
-    fatawa = []
-    failed = 0
-
-    for fatwa_id in tqdm(fatwa_ids, desc="Scraping fatawa"):
-        fatwa = fetch_fatwa(fatwa_id)
-
-        if fatwa:
-            fatawa.append(fatwa)
-        else:
-            failed += 1
+    # Fetch concurrently, then keep results in the requested ID order
+    results = {}
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {executor.submit(fetch_fatwa, fatwa_id): fatwa_id for fatwa_id in fatwa_ids}
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Scraping fatawa"):
+            results[futures[future]] = future.result()
 
-        # Rate limiting - be respectful
-        time.sleep(1.0)  # 1 second between requests
+    fatawa = [results[fatwa_id] for fatwa_id in fatwa_ids if results[fatwa_id]]
+    failed = len(fatwa_ids) - len(fatawa)
 
     # Save to JSON
     output_file = OUTPUT_DIR / 'islamqa_fatawa.json'
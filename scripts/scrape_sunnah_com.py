@@ -10,7 +10,10 @@ import os
 from pathlib import Path
 from typing import List, Dict, Any
 from tqdm import tqdm
-import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from _http import MAX_WORKERS, RATE_LIMIT_CALLS, RATE_LIMIT_PERIOD, RateLimiter, create_session, retry_transient
+from _patterns import TAG_RE, WS_RE
 
 # API Base URL
 SUNNAH_API_BASE = "https://api.sunnah.com/v1"
@@ -28,17 +31,34 @@ COLLECTIONS = {
 # Output directory
 OUTPUT_DIR = Path(__file__).parent.parent / 'data' / 'raw' / 'hadith'
 
+# Shared read-only default for missing nested hadith objects
+EMPTY_FIELDS = {}
+
+# Shared across all worker threads so connections are reused and the
+# request rate is limited in aggregate
+SESSION = create_session()
+RATE_LIMITER = RateLimiter(RATE_LIMIT_CALLS, RATE_LIMIT_PERIOD)
+
+
+@retry_transient
+def fetch_api_data(url: str, api_key: str) -> List[Dict]:
+    """Fetch the data list from an API endpoint, retrying transient failures"""
+    headers = {'X-API-Key': api_key} if api_key else {}
+
+    if not SESSION.cache.contains(url=url):  # Cache hits skip the rate limit
+        RATE_LIMITER.wait()
+    response = SESSION.get(url, headers=headers, timeout=30)
+    response.raise_for_status()
+    data = response.json()
+    return data.get('data', [])
+
 
 def fetch_collection_books(collection_name: str, api_key: str) -> List[Dict]:
     """Fetch the list of books in a collection"""
     url = f"{SUNNAH_API_BASE}/collections/{collection_name}/books"
-    headers = {'X-API-Key': api_key} if api_key else {}
 
     try:
-        response = requests.get(url, headers=headers, timeout=30)
-        response.raise_for_status()
-        data = response.json()
-        return data.get('data', [])
+        return fetch_api_data(url, api_key)
     except requests.exceptions.RequestException as e:
         print(f"Error fetching books for {collection_name}: {e}")
         return []
@@ -47,34 +67,33 @@ def fetch_collection_books(collection_name: str, api_key: str) -> List[Dict]:
 def fetch_book_hadiths(collection_name: str, book_number: int, api_key: str) -> List[Dict]:
     """Fetch all hadiths from a specific book"""
     url = f"{SUNNAH_API_BASE}/collections/{collection_name}/books/{book_number}/hadiths"
-    headers = {'X-API-Key': api_key} if api_key else {}
 
     try:
-        response = requests.get(url, headers=headers, timeout=30)
-        response.raise_for_status()
-        data = response.json()
-        return data.get('data', [])
+        return fetch_api_data(url, api_key)
     except requests.exceptions.RequestException as e:
         print(f"Error fetching hadiths for {collection_name} book {book_number}: {e}")
         return []
 
 
-def extract_hadith_info(hadith: Dict, collection_key: str, collection_name: str) -> Dict:
+def extract_hadith_info(hadith: Dict, collection_key: str, title: str, url_prefix: str) -> Dict:
     """Extract relevant information from hadith data"""
+    english = hadith.get('hadithEnglish') or EMPTY_FIELDS
+    arabic = hadith.get('hadithArabic') or EMPTY_FIELDS
+
     return {
         'id': f"{collection_key}_{hadith.get('hadithNumber', 'unknown')}",
         'type': 'hadith',
-        'ruling': hadith.get('hadithEnglish', {}).get('body', ''),
-        'arabicText': hadith.get('hadithArabic', {}).get('body', ''),
+        'ruling': english.get('body', ''),
+        'arabicText': arabic.get('body', ''),
         'source': {
-            'title': collection_name.replace('-', ' ').title(),
+            'title': title,
             'reference': f"Book {hadith.get('bookNumber', '?')}, Hadith {hadith.get('hadithNumber', '?')}",
             'collection': 'Kutub al-Sittah',
-            'url': f"https://sunnah.com/{collection_name}/{hadith.get('hadithNumber', '')}"
+            'url': url_prefix + str(hadith.get('hadithNumber', ''))
         },
         'authenticity': determine_authenticity(collection_key, hadith),
-        'topics': extract_topics(hadith),
-        'narrator': hadith.get('hadithEnglish', {}).get('chapterName', ''),
+        'topics': extract_topics(english, hadith.get('bookName', '')),
+        'narrator': english.get('chapterName', ''),
         'bookNumber': hadith.get('bookNumber'),
         'hadithNumber': hadith.get('hadithNumber'),
         'grades': hadith.get('grades', []),
@@ -102,24 +121,23 @@ def determine_authenticity(collection_key: str, hadith: Dict) -> str:
     return 'unknown'
 
 
-def extract_topics(hadith: Dict) -> List[str]:
-    """Extract topic tags from hadith metadata"""
+def extract_topics(english: Dict, book_name: str) -> List[str]:
+    """Extract topic tags from a hadith's English metadata and book name"""
     topics = []
 
     # Add chapter name as a topic
-    chapter = hadith.get('hadithEnglish', {}).get('chapterName', '')
+    chapter = english.get('chapterName', '')
     if chapter:
-        # Clean and split chapter name into topics
-        chapter_topics = chapter.lower().replace('chapter:', '').strip()
+        # Clean and split chapter name into topics (API names may carry HTML markup)
+        chapter_topics = WS_RE.sub(' ', TAG_RE.sub('', chapter)).lower().replace('chapter:', '').strip()
         if chapter_topics:
             topics.append(chapter_topics)
 
     # Add book name as a broader topic
-    book_name = hadith.get('bookName', '')
     if book_name:
         topics.append(book_name.lower().strip())
 
-    return list(set(topics))  # Remove duplicates
+    return list(dict.fromkeys(topics))  # Remove duplicates, keeping order
 
 
 def scrape_collection(collection_key: str, collection_name: str, api_key: str):
@@ -142,30 +160,35 @@ def scrape_collection(collection_key: str, collection_name: str, api_key: str):
 
     print(f"Found {len(books)} books in {collection_name}")
 
-    all_hadiths = []
+    book_numbers = [book.get('bookNumber') for book in books if book.get('bookNumber')]
 
-    # Fetch hadiths from each book
-    for book in tqdm(books, desc="Processing books"):
-        book_number = book.get('bookNumber')
-        if not book_number:
-            continue
+    # Fetch books concurrently, then process them in book order
+    book_hadiths = {}
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {
+            executor.submit(fetch_book_hadiths, collection_name, book_number, api_key): book_number
+            for book_number in book_numbers
+        }
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Processing books"):
+            book_hadiths[futures[future]] = future.result()
 
-        # Fetch hadiths
-        hadiths = fetch_book_hadiths(collection_name, book_number, api_key)
+    # Per-collection source fields, shared by every hadith
+    title = collection_name.replace('-', ' ').title()
+    url_prefix = f"https://sunnah.com/{collection_name}/"
 
+    all_hadiths = []
+
+    for book_number in book_numbers:
         # Process each hadith
-        for hadith in hadiths:
+        for hadith in book_hadiths[book_number]:
             try:
-                hadith_info = extract_hadith_info(hadith, collection_key, collection_name)
+                hadith_info = extract_hadith_info(hadith, collection_key, title, url_prefix)
                 if hadith_info['ruling']:  # Only save if we have text
                     all_hadiths.append(hadith_info)
             except Exception as e:
                 print(f"Error processing hadith: {e}")
                 continue
 
-        # Rate limiting - be respectful to the API
-        time.sleep(0.5)
-
     # Save to JSON file
     output_file = collection_dir / f"{collection_key}_hadiths.json"
     with open(output_file, 'w', encoding='utf-8') as f: